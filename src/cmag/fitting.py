@@ -51,9 +51,143 @@ function. Models can be encoded in this module using the `CMagRadialModel` type
 in the `cmag.models` subpackage.
 """
 
+from functools import lru_cache
+
+import torch
+from numpy import (
+    argsort, asarray, ascontiguousarray, cumsum, exp, int32, log, sqrt, sum)
+from scipy.optimize import minimize
+
+from ._fastloss import hh91_cumarea_mse, mse, rss
+from .hh91 import HH91_cumarea
+
+def _get_cmagmodel():
+    """Returns the `CMagModel` type from `cmag.models`.
+
+    The import is deferred because `cmag.models` itself imports this module;
+    after the first call the type is bound at module scope.
+    """
+    global CMagModel
+    from .models import CMagModel
+    return CMagModel
+CMagModel = None
+
 
 # Fitting C.Mag. ##############################################################
 
+class LogExp:
+    """A log/exp parameter transformation for the `argtx` fitting option.
+
+    `LogExp` implements the `(argin, argex)` pair accepted by the `argtx`
+    option of `fit_cumarea`: parameters are searched in log-space (keeping
+    them positive) and exponentiated back before being passed to the model.
+    Unlike a plain `(np.log, np.exp)` tuple, the transformations dispatch on
+    their input type, so when the fit runs on torch tensors the reverse
+    transformation uses `torch.exp` and participates in the autograd graph
+    with no numpy round-trip. An instance can be indexed or unpacked like a
+    2-tuple of `(argin, argex)`.
+    """
+    @staticmethod
+    def argin(params):
+        if torch.is_tensor(params):
+            return torch.log(params)
+        return log(params)
+    @staticmethod
+    def argex(params):
+        if torch.is_tensor(params):
+            return torch.exp(params)
+        return exp(params)
+    def __getitem__(self, index):
+        return (self.argin, self.argex)[index]
+    def __iter__(self):
+        return iter((self.argin, self.argex))
+# The shared instance used as the default argtx of the log-parameterized
+# models in cmag.models.
+log_exp = LogExp()
+
+@lru_cache(maxsize=32)
+def _resolve_cumarea_fn(formfn):
+    """Returns the cumulative-area function for a `CMagModel` subclass.
+
+    For a `CMagRadialModel`, this is the model's `radial_cumarea` classmethod;
+    for other `CMagModel` subclasses, `None` is returned (and a warning is
+    issued), indicating that the caller must fall back on evaluating the model
+    along the horizontal meridian. The resolution is cached so that repeated
+    fits of the same model--such as the per-label fits made by
+    `cmag.hcp.fit_cmag_data`--do not repeat the subclass checks or re-issue
+    the warning.
+    """
+    from .models import CMagRadialModel
+    if issubclass(formfn, CMagRadialModel):
+        return formfn.radial_cumarea
+    from warnings import warn
+    warn(
+        f"cortical magnification model of type {formfn} is a CMagModel but"
+        f" not a CMagRadialModel; using model(x=eccen, y=0)")
+    return None
+
+@lru_cache(maxsize=32)
+def _as_torch_fn(fn):
+    """Returns a torch-compatible equivalent of the given numpy function.
+
+    Parameter transformations such as `argtx=(np.log, np.exp)` are typically
+    given in terms of numpy ufuncs, which cannot be applied to torch tensors
+    that require gradients. This function maps the common numpy ufuncs onto
+    their torch equivalents; any unrecognized function is returned unchanged
+    (and is assumed to be torch-compatible already).
+    """
+    import numpy as np
+    known = {
+        np.log: torch.log,
+        np.exp: torch.exp,
+        np.sqrt: torch.sqrt,
+        np.square: torch.square}
+    return known.get(fn, fn)
+
+def _bucket_sort_by_eccen(eccen, *payloads, nbuckets=4096, emax=Ellipsis):
+    """Sorts the given arrays by eccentricity using integer bucket keys.
+
+    `_bucket_sort_by_eccen(eccen, *payloads)` returns a tuple whose first
+    element is the sorted copy of `eccen` and whose remaining elements are the
+    payload arrays reordered the same way. The eccentricities are quantized
+    into `nbuckets` uniform buckets over `[0, emax]` and sorted by bucket key
+    using numpy's stable integer sort, which is a linear-time radix sort
+    rather than the O(N log N) comparison sort used by a plain `argsort` on
+    floats. Vertices that fall in the same bucket (within `emax / nbuckets`
+    degrees of one another, roughly 0.002 degrees with the defaults) keep
+    their input order; this is far below the precision of pRF eccentricity
+    estimates and has no practical effect on cumulative-area fits.
+
+    If `emax` is `Ellipsis` (the default), then `cmag.hcp.config.max_eccen` is
+    used. If any eccentricity falls outside `[0, emax]`, the function falls
+    back on an exact comparison sort.
+    """
+    if emax is Ellipsis:
+        from .hcp.config import max_eccen as emax
+    emax = float(emax)
+    if eccen.size > 0 and 0 <= eccen.min() and eccen.max() <= emax:
+        keys = (eccen * (nbuckets / emax)).astype(int32)
+        ii = argsort(keys, kind='stable')
+    else:
+        ii = argsort(eccen)
+    return (eccen[ii],) + tuple(p[ii] for p in payloads)
+
+def _sort_and_cumsum(eccen, sarea, nbuckets=4096, emax=Ellipsis):
+    """Sorts the vertices by eccentricity and accumulates their areas.
+
+    `_sort_and_cumsum(eccen, sarea)` returns a tuple `(eccen_sorted, cumsa)`
+    where `cumsa` is the cumulative sum of the eccentricity-sorted surface
+    areas. This is the fused equivalent of `_bucket_sort_by_eccen(eccen,
+    sarea)` followed by a `cumsum`: because the sort's gather of the surface
+    areas already produces a fresh buffer, the cumulative sum is computed in
+    place in that buffer, saving one N-element allocation and one pass over
+    the data.
+    """
+    (eccen, sarea) = _bucket_sort_by_eccen(
+        eccen, sarea, nbuckets=nbuckets, emax=emax)
+    cumsum(sarea, out=sarea)
+    return (eccen, sarea)
+
 def fit_cumarea(surface_areas, eccen,
                 formfn, params0,
                 total_area=1,
@@ -63,6 +197,10 @@ def fit_cumarea(surface_areas, eccen,
                 lossfn='mse',
                 weights=None,
                 argtx=Ellipsis,
+                presorted=False,
+                method=Ellipsis,
+                dtype='float32',
+                work=None,
                 **kwargs):
     """Fits a model of cortical magnification to a set of data using the method
     of cumulative surface area.
@@ -142,7 +280,11 @@ def fit_cumarea(surface_areas, eccen,
         two arguments: `lossfn(meas, pred)` where `meas` is the measured
         surface area provided by the parameters `prf_x`, `prf_y`, and
         `surface_area`. If not given or if the value is `None`, then the mean
-        squared error (MSE) is used.
+        squared error (MSE) is used. When the loss function is given by name
+        (`'mse'` or `'rss'`) and `formfn` is a `CMagModel`, the gradient of
+        the loss is calculated using torch's autograd system and is supplied
+        to the optimizer as an analytic Jacobian, which substantially reduces
+        the number of model evaluations per optimization step.
     weights : None or vector of floats, optional
         The weights to apply to the calculation of the loss function. If `None`
         or not provided, the no weights are used (i.e., all vertices are
@@ -162,6 +304,37 @@ def fit_cumarea(surface_areas, eccen,
         is used. Because `exp(in_r)` is always positive for real-valued `r`,
         this prevents the parameter used in the `formfn` from becoming invalid
         during the search.
+    presorted : boolean, optional
+        Whether the `surface_areas` and `eccen` arguments are already sorted
+        by eccentricity. If `True`, then the initial eccentricity sort of the
+        vertices is skipped; this is useful for callers (such as
+        `cmag.hcp.fit_cmag_data`) that sort their data once and fit several
+        subsets of it. The default is `False`.
+    method : str or Ellipsis or None, optional
+        The optimization method to use, as understood by the function
+        `scipy.optimize.minimize`. The default (`Ellipsis`) selects
+        `'L-BFGS-B'` when an analytic Jacobian is available (see `lossfn`),
+        which requires far fewer iterations than a derivative-free search,
+        and `'Nelder-Mead'` otherwise: without a Jacobian, scipy estimates
+        the gradient by finite differences whose default step is smaller
+        than the resolution of a float32 objective, which silently stalls a
+        gradient-based search at the initial parameters. If `method` is
+        `None` and no Jacobian is available, then `'Nelder-Mead'` is used;
+        if a Jacobian is available, then the choice of method is left to
+        scipy.
+    dtype : dtype-like, optional
+        The dtype in which the surface areas and eccentricities are stored
+        during the fit. The default is `'float32'`, which halves the memory
+        bandwidth of every model evaluation relative to float64 and is ample
+        precision for cumulative surface-area data; pass `'float64'` for
+        models that require the extra precision.
+    work : array of floats or None, optional
+        An optional preallocated buffer, at least as long as `eccen` and of
+        the fit's dtype, into which the cumulative surface area is computed
+        when `presorted` is `True`. Callers that fit many subsets of one
+        dataset (such as `cmag.hcp.fit_cmag_data`) can allocate this buffer
+        once and avoid a fresh N-element allocation per fit. If `None` (the
+        default), then a new array is allocated.
     **kwargs
         Any additional options are passed to the `scipy.optimize.minimize`
         function directly.
@@ -174,71 +347,174 @@ def fit_cumarea(surface_areas, eccen,
         returned object with either the given or fitted total area, in square
         mm.
     """
-    from numpy import asarray, argsort, sum, cumsum, mean, sqrt, square
-    from scipy.optimize import minimize
-    from .models import CMagModel, CMagRadialModel
-    sarea = asarray(surface_areas)
-    eccen = asarray(eccen)
+    cmagmodel = CMagModel or _get_cmagmodel()
+    # Convert the vertex data to the target precision (and contiguity) once,
+    # up front; every optimizer iteration streams over these arrays.
+    sarea = ascontiguousarray(surface_areas, dtype=dtype)
+    eccen = ascontiguousarray(eccen, dtype=dtype)
     params0 = asarray(params0, dtype=eccen.dtype)
-    ii = argsort(eccen)
-    sarea = sarea[ii]
-    eccen = eccen[ii]
-    cumsa = cumsum(sarea)
+    if presorted:
+        if work is None:
+            cumsa = cumsum(sarea)
+        else:
+            cumsa = cumsum(sarea, out=work[:len(sarea)])
+    else:
+        (eccen, cumsa) = _sort_and_cumsum(eccen, sarea)
     if argtx is None:
         argtx = (lambda a:a, lambda a:a)
     elif argtx is Ellipsis:
         if hasattr(formfn, 'argtx'):
             argtx = formfn.argtx
+        else:
+            argtx = (lambda a:a, lambda a:a)
     else:
         params0 = argtx[0](params0)
+    lossname = lossfn if isinstance(lossfn, str) else None
     if lossfn == 'rss':
-        def lossfn(gold, pred):
-            return sum((gold - pred)**2)
+        lossfn = rss
     elif lossfn == 'mse':
         if weights is None:
-            def lossfn(gold, pred):
-                return mean((gold - pred)**2)
+            lossfn = mse
         else:
-            wsum = sum(weights)
+            # Folding sqrt(weights / wsum) into the measured curve and the
+            # prediction turns the weighted MSE into a plain sum of squares;
+            # the objective is unchanged, but the per-iteration weight
+            # multiply and normalization are eliminated.
+            warr = sqrt(asarray(weights, dtype=cumsa.dtype) / sum(weights))
+            cumsa = cumsa * warr
             def lossfn(gold, pred):
-                return sum(weights * (gold - pred)**2) / wsum
-    if issubclass(formfn, CMagModel):
-        import torch
+                return rss(gold, warr * pred)
+    # A formfn may be a plain function rather than a CMagModel subclass, and
+    # issubclass raises a TypeError for non-class arguments.
+    is_cmagmodel = isinstance(formfn, type) and issubclass(formfn, cmagmodel)
+    if is_cmagmodel:
+        # Hoist the tensors that are invariant across optimizer iterations;
+        # stepfn may be called thousands of times per fit, so per-iteration
+        # tensor construction and numpy round-trips are pure overhead.
         ecctns = torch.as_tensor(eccen)
-        if issubclass(formfn, CMagRadialModel):
-            fn = formfn.radial_cumarea
-        else:
-            from warnings import warn
-            warn(
-                f"cortical magnification model of type {type(formfn)} is a"
-                f" CMagModel but not a CMagRadialModel; using model(x=eccen,"
-                f" y=0)")
+        cumsa_t = torch.as_tensor(cumsa)
+        fn = _resolve_cumarea_fn(formfn)
+        if fn is None:
             y = ecctns * 0
             fn = lambda x, *args: formfn.areal_cumarea(x, y, *args)
-        def stepfn(params, *args):
-            if fit_total_area:
-                txparams = torch.as_tensor(argtx[1](params[:-1]))
-                totarea = torch.square(torch.as_tensor(params[-1]))
-            else:
-                txparams = torch.as_tensor(argtx[1](params))
-                totarea = total_area
-            pred = fn(ecctns, totarea, fov, hemifields, *txparams, *args)
-            l = lossfn(cumsa, pred.numpy())
-            return l
         if fit_total_area:
+            # The total area must stay positive, so, like the model's other
+            # log-transformed parameters, it is searched in log-space; this
+            # reuses the argtx machinery's exp instead of a separate
+            # sqrt/square reparameterization.
             params0 = list(params0)
-            params0.append(sqrt(total_area))
+            params0.append(log(total_area))
+        # When the loss is given by name, we can build a torch-native version
+        # of it and let autograd compute the gradient of the loss with respect
+        # to the parameters; supplying this analytic Jacobian to minimize
+        # saves one stepfn evaluation per parameter per iteration (the cost of
+        # estimating the gradient by finite differences).
+        if lossname == 'rss':
+            def tlossfn(gold, pred):
+                return torch.sum((gold - pred)**2)
+        elif lossname == 'mse':
+            if weights is None:
+                def tlossfn(gold, pred):
+                    return torch.mean((gold - pred)**2)
+            else:
+                # The sqrt(weights / wsum) factor has already been folded
+                # into cumsa (above), so only the prediction needs scaling.
+                wtns = torch.as_tensor(warr)
+                def tlossfn(gold, pred):
+                    return torch.sum((gold - wtns * pred)**2)
+        else:
+            tlossfn = None
+        argex = _as_torch_fn(argtx[1])
+        # The parameter buffer is shared across iterations: filling its numpy
+        # view in place avoids allocating a fresh tensor on every call.
+        param_buf = torch.empty(len(params0), dtype=ecctns.dtype)
+        param_np = param_buf.numpy()
+        # fit_total_area and the loss flavor are fixed at fit time, so rather
+        # than re-testing them on every optimizer call, we bind one of a few
+        # specialized closures here.
+        if tlossfn is None:
+            def evalloss(pred):
+                return lossfn(cumsa, pred.detach().numpy())
+        else:
+            def evalloss(pred):
+                return tlossfn(cumsa_t, pred).item()
+        if fit_total_area:
+            def stepfn(params, *args):
+                param_np[:] = params
+                pred = fn(
+                    ecctns, torch.exp(param_buf[-1]), fov, hemifields,
+                    *argex(param_buf[:-1]), *args)
+                return evalloss(pred)
+        else:
+            def stepfn(params, *args):
+                param_np[:] = params
+                pred = fn(
+                    ecctns, total_area, fov, hemifields,
+                    *argex(param_buf), *args)
+                return evalloss(pred)
+        if tlossfn is not None and 'jac' not in kwargs:
+            if fit_total_area:
+                def stepfn_grad(params, *args):
+                    params = torch.tensor(
+                        params, dtype=ecctns.dtype, requires_grad=True)
+                    pred = fn(
+                        ecctns, torch.exp(params[-1]), fov, hemifields,
+                        *argex(params[:-1]), *args)
+                    loss = tlossfn(cumsa_t, pred)
+                    loss.backward()
+                    return (loss.item(), params.grad.detach().numpy())
+            else:
+                def stepfn_grad(params, *args):
+                    params = torch.tensor(
+                        params, dtype=ecctns.dtype, requires_grad=True)
+                    pred = fn(
+                        ecctns, total_area, fov, hemifields,
+                        *argex(params), *args)
+                    loss = tlossfn(cumsa_t, pred)
+                    loss.backward()
+                    return (loss.item(), params.grad.detach().numpy())
+            # Not every model supports autograd (a model can break the graph
+            # by calling out to numpy or scipy), so we probe the gradient once
+            # and keep the finite-difference stepfn if the probe fails.
+            try:
+                stepfn_grad(asarray(params0, dtype=float))
+                stepfn = stepfn_grad
+                kwargs['jac'] = True
+            except RuntimeError:
+                pass
     elif fit_total_area:
         raise ValueError(
             "total_area='fit' can only be used with CMagModel forms")
     else:
-        def stepfn(params, *args):
-            txparams = argtx[1](params)
-            pred = formfn(eccen, *txparams, *args)
-            return lossfn(cumsa, pred)
-    r = minimize(stepfn, params0, **kwargs)
+        argex = argtx[1]
+        if (formfn is HH91_cumarea and lossname == 'mse'
+            and weights is None and len(params0) == 2):
+            # The HH91 cumulative-area fit is common enough to deserve a
+            # specialized objective: the closed form and the MSE loss are
+            # fused into a single kernel with no intermediate arrays. Any
+            # extra argument supplied through minimize's args option is the
+            # hemifields value of HH91_cumarea and is forwarded to the
+            # kernel, which takes the same parameter.
+            def stepfn(params, *args):
+                (a, b) = argex(params)
+                return hh91_cumarea_mse(
+                    eccen, cumsa, float(a), float(b),
+                    *(float(arg) for arg in args))
+        else:
+            def stepfn(params, *args):
+                txparams = argex(params)
+                pred = formfn(eccen, *txparams, *args)
+                return lossfn(cumsa, pred)
+    if method is Ellipsis:
+        # L-BFGS-B is only worthwhile with a usable gradient; scipy's
+        # finite-difference step is below float32 resolution, so a no-
+        # Jacobian fit would see a zero gradient and stop at params0.
+        method = 'L-BFGS-B' if kwargs.get('jac') else 'Nelder-Mead'
+    elif method is None and not kwargs.get('jac'):
+        method = 'Nelder-Mead'
+    r = minimize(stepfn, params0, method=method, **kwargs)
     if fit_total_area:
-        total_area = square(r.x[-1])
+        total_area = exp(r.x[-1])
         r.x = r.x[:-1]
         r.total_area = total_area
     r.x = argtx[1](r.x)
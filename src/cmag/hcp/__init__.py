@@ -18,12 +18,19 @@ cached HCP data.
 from . import config
 from . import data
 
-# We can extract a subject list using neuropythy:
-import neuropythy as ny, numpy as np
-sids = np.array(ny.data['hcp_lines'].subject_list)
-sids.setflags(write=False)
-# To keep the data namespace clean, we delete the library imports.
-del ny, np
+def __getattr__(name):
+    # The subject list is extracted using neuropythy, but importing
+    # neuropythy triggers its full data-registry initialization; loading the
+    # list lazily keeps `import cmag` fast for users who never touch the HCP
+    # data. Once loaded, the array is bound in the module namespace, so this
+    # hook only runs on the first access.
+    if name == 'sids':
+        import neuropythy as ny, numpy as np
+        sids = np.array(ny.data['hcp_lines'].subject_list)
+        sids.setflags(write=False)
+        globals()['sids'] = sids
+        return sids
+    raise AttributeError(name)
 
 def fit_cmag_data(data, formfn, params0,
                   fov=Ellipsis,
@@ -126,33 +133,86 @@ def fit_cmag_data(data, formfn, params0,
         lossfn=lossfn,
         argtx=argtx,
         hemifields=hemifields)
-    if not filter:
-        filter = lambda dat: True
     if labels is None:
         labels = range(1,11)
     # If we were passed a 2-tuple of (lh,rh) data, join them.
     if isinstance(data, tuple) and len(data) == 2:
         from .data import joinhemis
         data = joinhemis(data)
-    res = []
-    for lbl in ([labels] if isinstance(labels, int) else labels):
-        ii = filter(data) & (data['label'] == lbl)
-        if np.sum(ii) < 5:
-            r = None
-        else:
-            weights = None if not weights else data[weights][ii]
-            sarea = data['surface_area'][ii]
-            eccen = data['eccentricity'][ii]
-            r = fit_cumarea(
-                sarea,
-                eccen,
-                formfn, params0,
-                total_area=np.sum(sarea) * 2,
-                fov=fov,
-                fit_total_area=True,
-                weights=weights,
-                **kw)
-        res.append(r)
+    # Rather than scanning the full label array once per label, we sort the
+    # vertices once by (label, eccentricity) and pull out each label's slice
+    # of the sorted arrays; the slices are already eccentricity-sorted, so
+    # fit_cumarea can skip its internal argsort (presorted=True).
+    lbl_arr = data['label']
+    sarea_arr = data['surface_area']
+    eccen_arr = data['eccentricity']
+    wght_arr = data[weights] if weights else None
+    if filter:
+        mask = filter(data)
+        lbl_arr = lbl_arr[mask]
+        sarea_arr = sarea_arr[mask]
+        eccen_arr = eccen_arr[mask]
+        if wght_arr is not None:
+            wght_arr = wght_arr[mask]
+    order = np.lexsort((eccen_arr, lbl_arr))
+    lbl_arr = lbl_arr[order]
+    # Converting to the fit dtype here (rather than once per label inside
+    # fit_cumarea) means the per-label slices are passed through without
+    # copies; the shared work buffer likewise avoids a fresh cumulative-sum
+    # allocation for every label.
+    sarea_arr = sarea_arr[order].astype(np.float32, copy=False)
+    eccen_arr = eccen_arr[order].astype(np.float32, copy=False)
+    if wght_arr is not None:
+        wght_arr = wght_arr[order]
+    work = np.empty(len(sarea_arr), dtype=np.float32)
+    labels_seq = [labels] if isinstance(labels, int) else list(labels)
+    los = np.searchsorted(lbl_arr, labels_seq, side='left')
+    his = np.searchsorted(lbl_arr, labels_seq, side='right')
+    def fitjob(lo, hi):
+        sarea = sarea_arr[lo:hi]
+        return fit_cumarea(
+            sarea,
+            eccen_arr[lo:hi],
+            formfn, params0,
+            total_area=np.sum(sarea) * 2,
+            fov=fov,
+            fit_total_area=True,
+            weights=None if wght_arr is None else wght_arr[lo:hi],
+            presorted=True,
+            work=work[lo:hi],
+            **kw)
+    res = [None] * len(labels_seq)
+    jobs = [
+        (resno, lo, hi)
+        for (resno, (lo, hi)) in enumerate(zip(los, his))
+        if hi - lo >= 5]
+    if len(jobs) < 2:
+        for (resno, lo, hi) in jobs:
+            res[resno] = fitjob(lo, hi)
+    else:
+        # The per-label fits are fully independent (disjoint slices of the
+        # sorted arrays, including the work buffer), and the numpy/torch ops
+        # inside each fit release the GIL, so the labels can run in parallel
+        # threads. Torch's own intra-op thread pool is restricted to one
+        # thread while the label pool runs so the two do not multiply.
+        from concurrent.futures import ThreadPoolExecutor
+        from os import cpu_count
+        from ..models import CMagModel
+        use_torch = isinstance(formfn, type) and issubclass(formfn, CMagModel)
+        if use_torch:
+            import torch
+            nthreads = torch.get_num_threads()
+            torch.set_num_threads(1)
+        try:
+            with ThreadPoolExecutor(min(len(jobs), cpu_count() or 1)) as pool:
+                futs = [
+                    (resno, pool.submit(fitjob, lo, hi))
+                    for (resno, lo, hi) in jobs]
+                for (resno, fut) in futs:
+                    res[resno] = fut.result()
+        finally:
+            if use_torch:
+                torch.set_num_threads(nthreads)
     return res[0] if isinstance(labels, int) else tuple(res)
 
 __all__ = (
@@ -72,15 +72,21 @@ def label_lookup(name):
     If the name is not found, then a `KeyError` is raised. Note that `None` is
     considered a valid name and will result in the return value of 0.
     """
+    key = label_lookup._label_key
     if label_names is not label_lookup._label_names:
         # Generate a new key.
-        label_lookup._label_key = {
-            (nm.upper() if isinstance(nm, str) else nm): index
-            for (index, nm) in enumerate(label_names)}
+        key.clear()
+        key.update(
+            (nm.upper() if isinstance(nm, str) else nm, index)
+            for (index, nm) in enumerate(label_names))
         label_lookup._label_names = label_names
     if isinstance(name, str):
         name = name.upper()
-    return label_lookup._label_key[name.upper()]
+    return key[name]
+# The lookup key is cached on the function itself and is rebuilt only when the
+# label_names tuple is replaced.
+label_lookup._label_names = None
+label_lookup._label_key = {}
 
 
 # Visual Field ################################################################
@@ -19,6 +19,102 @@ function can be used to load subject data.
 """
 
 
+def _load_vdata(sid, h, label_path, cache_path, overwrite):
+    """Returns the `(vdata, faces)` pair for the given subject/hemisphere.
+
+    This is the cache-handling core of the `load` function: it generates the
+    cache files if needed and otherwise reads them. The `vdata` return value
+    is the raw `12 x N` float32 vertex matrix; see `load` for the meaning of
+    its rows and of the parameters.
+    """
+    import numpy as np
+    import neuropythy as ny
+    from pathlib import Path
+    if cache_path is None:
+        cfile = None
+        vfile = None
+        ffile = None
+        cached = False
+    else:
+        if cache_path is Ellipsis:
+            from .config import cache_path
+        cache_path = Path(cache_path)
+        # The cache format is a single .npz container per subject and
+        # hemisphere; one file instead of two means half the open/stat
+        # syscalls and header parses when iterating over the dataset. The
+        # legacy pair of .npy files is still read when found.
+        cfile = cache_path / f'{h}.{sid}.npz'
+        vfile = cache_path / f'{h}.{sid}_vert.npy'
+        ffile = cache_path / f'{h}.{sid}_face.npy'
+        cached = cfile.is_file() or (vfile.is_file() and ffile.is_file())
+    if overwrite or not cached:
+        if label_path is Ellipsis:
+            from .config import label_path
+        sub = ny.data['hcp_lines'].subjects[sid]
+        hem = sub.hemis[h]
+        labelfile = Path(label_path.format(sid=sid, hemisphere=h))
+        if not labelfile.is_file():
+            raise RuntimeError(f"label file not found for subject {sid}/{h}")
+        lbl = ny.load(str(labelfile))
+        nz = (lbl > 0)
+        msh = hem.surface('midgray').submesh(nz)
+        vid = msh.labels
+        n = vid.size
+        # Rather than np.stack (which builds a temporary list of 12 arrays
+        # and then copies them into a fresh buffer with a cast per column),
+        # the vertex matrix is preallocated once and each source is copied
+        # into its row directly.
+        vdata = np.empty((12, n), dtype=np.float32)
+        np.copyto(vdata[0], vid, casting='unsafe')
+        np.copyto(vdata[1], lbl[vid], casting='unsafe')
+        np.copyto(vdata[2], msh.prop('prf_x'))
+        np.copyto(vdata[3], msh.prop('prf_y'))
+        np.copyto(vdata[4], msh.prop('prf_radius'))
+        np.copyto(vdata[5], msh.prop('prf_polar_angle'))
+        np.copyto(vdata[6], msh.prop('prf_eccentricity'))
+        np.copyto(vdata[7], msh.prop('prf_variance_explained'))
+        np.copyto(vdata[8], msh.prop('midgray_surface_area'))
+        np.copyto(vdata[9:], msh.coordinates)
+        # Neuropythy returns int64 face indices, but a single-hemisphere
+        # submesh has far fewer than 2**31 vertices; caching int32 halves
+        # the face matrix's disk size and load bandwidth.
+        faces = np.ascontiguousarray(msh.tess.indexed_faces, dtype=np.int32)
+        if cfile:
+            np.savez(cfile, vert=vdata, face=faces)
+    elif cfile.is_file():
+        # Uncompressed npz members are stored as plain .npy blocks, so this
+        # costs the same reads as the legacy pair of files without the extra
+        # per-file open/stat/header overhead.
+        npz = np.load(cfile)
+        vdata = npz['vert']
+        faces = npz['face']
+    else:
+        # Memory-map the legacy cache files rather than reading them whole:
+        # the OS page cache then handles residency lazily, which keeps the
+        # resident set small when iterating over all subjects but only
+        # touching a few fields of each.
+        vdata = np.load(vfile, mmap_mode='r')
+        faces = np.load(ffile, mmap_mode='r')
+    return (vdata, faces)
+
+def _make_data(vdata, faces):
+    """Converts a `12 x N` vertex matrix and a face matrix into the data
+    dictionary returned by the `load` function.
+    """
+    import numpy as np
+    # The cache stores float32, and each row of the C-ordered stack is
+    # already contiguous, so the rows are returned directly; upcasting to
+    # float64 here would double the memory footprint and copy cost of every
+    # subject, which matters when loading all 163 subjects at once.
+    return dict(
+        vertex_label=vdata[0].astype(np.int32),
+        label=vdata[1].astype(np.int32),
+        x=vdata[2], y=vdata[3], sigma=vdata[4],
+        polar_angle=vdata[5], eccentricity=vdata[6], cod=vdata[7],
+        surface_area=vdata[8],
+        coordinates=vdata[9:],
+        faces=faces)
+
 def load(sid, h,
          label_path=Ellipsis,
          cache_path=Ellipsis,
@@ -32,7 +128,10 @@ def load(sid, h,
     `load` function also generates cache files in a directory specified by the
     option `cache_path` and loads these files on subsequent invocations. The
     `cache_path` may be set to `Ellipsis` in order to use the cache path
-    specified in the `cmag.hcp.config` subpackage.
+    specified in the `cmag.hcp.config` subpackage. The cache is written as a
+    single `.npz` container per subject and hemisphere; legacy caches
+    consisting of separate `_vert.npy` and `_face.npy` files are still
+    recognized and are loaded as memory-maps.
     
     Parameters
     ----------
@@ -61,66 +160,74 @@ def load(sid, h,
         contains the following keys: `'label', 'x', 'y', 'sigma',
         'polar_angle', 'eccentricity', 'surface_area', 'cod', 'midgray_x',
         'midgray_y', 'midgray_z', 'faces'`. All of these except for `faces` are
-        vertex-wise values. The `faces` entry is a `3 x M` matrix of indices of
-        the corner vertices for each of the triangle faces included in the
+        vertex-wise values; the float-valued entries are float32 arrays, as
+        stored in the cache. The `faces` entry is a `3 x M` matrix of indices
+        of the corner vertices for each of the triangle faces included in the
         visual areas.
     """
+    (vdata, faces) = _load_vdata(sid, h, label_path, cache_path, overwrite)
+    return _make_data(vdata, faces)
+
+def load_all(sids, hemis=('lh', 'rh'),
+             label_path=Ellipsis,
+             cache_path=Ellipsis,
+             overwrite=False,
+             max_workers=8):
+    """Loads the data for many HCP subjects and hemispheres at once.
+
+    `load_all(sids)` returns a dictionary that maps each `(sid, h)` tuple to
+    the data dictionary that `load(sid, h)` would return. The per-subject
+    cache files are read concurrently in a thread pool (file reads release
+    the GIL, so concurrent reads can saturate the disk), and the vertex
+    matrices are then copied into a single preallocated slab so that the
+    whole dataset occupies one contiguous block of memory; each subject's
+    vertex-wise fields are views into this slab.
+
+    Parameters
+    ----------
+    sids : sequence of ints
+        The subject IDs of the HCP subjects whose data are to be loaded.
+    hemis : sequence of strs, optional
+        The hemispheres to load for each subject; by default, both `'lh'` and
+        `'rh'` are loaded.
+    label_path : Ellipsis or path-like, optional
+        See `load`.
+    cache_path : Ellipsis or path-like, optional
+        See `load`.
+    overwrite : boolean, optional
+        See `load`.
+    max_workers : int, optional
+        The number of threads used to read the cache files concurrently; the
+        default is 8.
+
+    Returns
+    -------
+    dict
+        A dictionary whose keys are the `(sid, h)` tuples and whose values
+        are the corresponding data dictionaries, as returned by `load`.
+    """
     import numpy as np
-    import neuropythy as ny
-    from pathlib import Path
-    if cache_path is None:
-        cachefile = None
-    else:
-        if cache_path is Ellipsis:
-            from .config import cache_path
-        vfile = Path(cache_path) / f'{h}.{sid}_vert.npy'
-        ffile = Path(cache_path) / f'{h}.{sid}_face.npy'
-    if overwrite or not (cache_path and vfile.is_file() and ffile.is_file()):
-        if label_path is Ellipsis:
-            from .config import label_path
-        sub = ny.data['hcp_lines'].subjects[sid]
-        hem = sub.hemis[h]
-        lbl = np.array(hem.prop('visual_area'), dtype=np.int16)
-        labelfile = Path(label_path.format(sid=sid, hemisphere=h))
-        if not labelfile.is_file():
-            raise RuntimeError(f"label file not found for subject {sid}/{h}")
-        lbl = ny.load(str(labelfile))
-        nz = (lbl > 0)
-        msh = hem.surface('midgray').submesh(nz)
-        vid = msh.labels
-        prf_x = msh.prop('prf_x')
-        prf_y = msh.prop('prf_y')
-        prf_sig = msh.prop('prf_radius')
-        prf_ang = msh.prop('prf_polar_angle')
-        prf_ecc = msh.prop('prf_eccentricity')
-        prf_cod = msh.prop('prf_variance_explained')
-        surfarea = msh.prop('midgray_surface_area')
-        mid_x = msh.coordinates[0]
-        mid_y = msh.coordinates[1]
-        mid_z = msh.coordinates[2]
-        vdata = np.stack(
-            [vid, lbl[vid],
-             prf_x, prf_y, prf_sig, prf_ang, prf_ecc, prf_cod,
-             surfarea, mid_x, mid_y, mid_z],
-            axis=0,
-            dtype=np.float32)
-        faces = msh.tess.indexed_faces
-        if vfile:
-            np.save(vfile, vdata)
-        if ffile:
-            np.save(ffile, faces)
-    else:
-        vdata = np.load(vfile)
-        faces = np.load(ffile)
-    vdata = vdata.astype(float)
-    return dict(
-        vertex_label=vdata[0].astype(np.int32),
-        label=vdata[1].astype(np.int32),
-        x=vdata[2], y=vdata[3], sigma=vdata[4],
-        polar_angle=vdata[5], eccentricity=vdata[6], cod=vdata[7],
-        surface_area=vdata[8],
-        coordinates=vdata[9:],
-        faces=faces)
+    from concurrent.futures import ThreadPoolExecutor
+    keys = [(sid, h) for sid in sids for h in hemis]
+    def loadfn(key):
+        return _load_vdata(key[0], key[1], label_path, cache_path, overwrite)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        raws = list(pool.map(loadfn, keys))
+    # Stash the loaded matrices into one slab allocation rather than leaving
+    # each subject in its own independently-allocated (or memory-mapped)
+    # buffer; this costs one copy but makes every later pass over the whole
+    # dataset a sequential walk of contiguous memory.
+    total = sum(vdata.shape[1] for (vdata, _) in raws)
+    slab = np.empty((12, total), dtype=np.float32)
+    res = {}
+    offset = 0
+    for (key, (vdata, faces)) in zip(keys, raws):
+        n = vdata.shape[1]
+        seg = slab[:, offset:(offset + n)]
+        np.copyto(seg, vdata)
+        res[key] = _make_data(seg, faces)
+        offset += n
+    return res
 
 def joinhemis(lhdata, rhdata=None, /):
     """Joins left and right hemisphere HCP data into a single data object.
@@ -128,20 +235,36 @@ def joinhemis(lhdata, rhdata=None, /):
     The `cmag.hcp.data.load` function returns a data structure (a dictionary of
     numpy arrays) for an individual hemisphere. To run analyses on the entire
     bilateral visual area, these hemispheres must be joined. This function can
-    be called either as `joinhemis(lhdata, rhdata)` or as 
-    `joinhemis((lhdata, rhdata))`. It returns the data with all keys joined and
-    the additional key `'hemisphere'` whose values are either `'lh'` or `'rh'`.
+    be called either as `joinhemis(lhdata, rhdata)` or as
+    `joinhemis((lhdata, rhdata))`. It returns the data with all keys joined
+    and the additional key `'hemisphere'` whose values are uint8 codes (0 for
+    LH and 1 for RH); the key `'hemisphere_labels'` holds the array `['lh',
+    'rh']` that translates the codes back into names. A uint8 code is an
+    eighth the size of a 2-character string entry, which matters when the
+    joined data is masked and copied in later analyses.
     """
-    from numpy import full, concatenate
+    from numpy import array, empty, uint8
     if rhdata is None:
         (lhdata, rhdata) = lhdata
     basic_keys = (
         'vertex_label', 'label', 'x', 'y', 'sigma', 'polar_angle',
         'eccentricity', 'cod', 'surface_area', 'coordinates', 'faces')
-    data = {
-        k: concatenate([lhdata[k], rhdata[k]], axis=-1)
-        for k in basic_keys}
+    # Preallocate each joined array and copy the hemispheres into it by slice
+    # assignment rather than calling concatenate, which builds an argument
+    # list and allocates its own intermediates.
+    data = {}
+    for k in basic_keys:
+        (lh, rh) = (lhdata[k], rhdata[k])
+        (nlh, nrh) = (lh.shape[-1], rh.shape[-1])
+        out = empty(lh.shape[:-1] + (nlh + nrh,), dtype=lh.dtype)
+        out[..., :nlh] = lh
+        out[..., nlh:] = rh
+        data[k] = out
     nlh = len(lhdata['label'])
     nrh = len(rhdata['label'])
-    data['hemisphere'] = concatenate([full(nlh, 'lh'), full(nrh, 'rh')])
+    hemi = empty(nlh + nrh, dtype=uint8)
+    hemi[:nlh] = 0
+    hemi[nlh:] = 1
+    data['hemisphere'] = hemi
+    data['hemisphere_labels'] = array(['lh', 'rh'])
     return data
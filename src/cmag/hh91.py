@@ -14,6 +14,13 @@ Horton JC, Hoyt WF (1991) The representation of the visual field in human
   109(6):816-24. doi:10.1001/archopht.1991.01080060080030.
 """
 
+import torch
+import numpy as np
+from numpy import pi
+
+from ._fastloss import hh91_areal
+
+
 def HH91(r, a=17.3, b=0.75, output='areal'):
     """Computes the V1 cortical magnification at the given eccentricity.
 
@@ -54,11 +61,22 @@ def HH91(r, a=17.3, b=0.75, output='areal'):
       striate cortex. A revision of the classic Holmes map. Arch Ophthalmol.
       109(6):816-24. doi:10.1001/archopht.1991.01080060080030.
     """
-    lin_cmag = (a / (r + b))
     if output == 'areal':
-        return lin_cmag ** 2
+        # The areal magnification over a numpy array of eccentricities is
+        # the hot path of the numpy-backend fits; route it through the fused
+        # kernel in cmag._fastloss, which evaluates (a / (r + b))**2 in a
+        # single pass instead of materializing each step as a temporary.
+        # The parameters must be scalars: the kernel writes one value per
+        # eccentricity, so array-valued a or b (which broadcast in the
+        # fallback expression) must not take this path.
+        if (isinstance(r, np.ndarray) and r.ndim == 1
+                and np.issubdtype(r.dtype, np.floating)
+                and not torch.is_tensor(a) and not torch.is_tensor(b)
+                and np.ndim(a) == 0 and np.ndim(b) == 0):
+            return hh91_areal(r, a, b, np.empty_like(r))
+        return (a / (r + b)) ** 2
     elif output == 'linear':
-        return lin_cmag
+        return a / (r + b)
     else:
         raise ValueError(
             f"invalid output parameter; valid choices are 'areal' or 'linear'")
@@ -127,15 +145,15 @@ def HH91_integral(ecc, maxecc=None, /, a=17.3, b=0.75, hemifields=2):
       striate cortex. A revision of the classic Holmes map. Arch Ophthalmol.
       109(6):816-24. doi:10.1001/archopht.1991.01080060080030.
     """
-    from torch import is_tensor
-    from numpy import pi
     # Process the arguments:
     (r0,r1) = (0, ecc) if maxecc is None else (ecc, maxecc)
-    # Figure out which backend we're using:
-    if any(map(is_tensor, (r0, r1, b))):
-        from torch import log
+    # Figure out which backend we're using (three O(1) checks; no iteration;
+    # r0 must be checked too, since in the two-argument form the tensor may
+    # be the minimum eccentricity with a scalar maximum):
+    if torch.is_tensor(r0) or torch.is_tensor(r1) or torch.is_tensor(b):
+        log1p = torch.log1p
     else:
-        from numpy import log
+        log1p = np.log1p
     # The Integral; according to Mathematica, the following input:
     #   Assuming[
     #     And[
@@ -155,13 +173,53 @@ def HH91_integral(ecc, maxecc=None, /, a=17.3, b=0.75, hemifields=2):
     #   = 2*pi * (a**2) * (b * (b - (b+r))/(b*(b+r)) + log((b+r)/b))
     #   = 2*pi * (a**2) * ((-r)/(b+r) + log((b+r)/b))
     #   = 2*pi * (a**2) * (log((b+r)/b) - r/(b+r)).
-    if r0 == 0:
-        b_r1 = r1 + b
-        return hemifields * pi * a**2 * (log(b_r1 / b) - r1 / b_r1)
-    else:
-        b_r0 = b + r0
-        b_r1 = b + r1
-        return hemifields * pi * a**2 * (b/b_r1 - b/b_r0 + log(b_r1/b_r0))
+    # The log term is written log1p(dr / b_r0) rather than log(b_r1 / b_r0):
+    # for thin rings (small r1 - r0) the latter cancels catastrophically
+    # against the rational term, while the log1p form keeps full precision
+    # in float32, which lets the rest of the pipeline stay single-precision.
+    # The general formula degenerates correctly at r0 == 0, so no branch is
+    # needed; a branch on r0 would also raise an ambiguous-truth error for
+    # tensor/array r0 and would break straight-line tracing of the body.
+    b_r0 = b + r0
+    b_r1 = b + r1
+    dr = r1 - r0
+    # Note that b/b_r1 - b/b_r0 == -b*dr/(b_r1*b_r0), which saves a
+    # division.
+    return hemifields * pi * a**2 * (
+        log1p(dr / b_r0) - b * dr / (b_r1 * b_r0))
+
+def HH91_cumarea(r, a=17.3, b=0.75, hemifields=2):
+    """Computes the cumulative V1 surface area at the given eccentricity.
+
+    `HH91_cumarea(r, a, b)` is equivalent to `HH91_integral(r, a=a, b=b)`: it
+    returns the predicted surface area of the portion of V1 devoted to the
+    central `r` degrees of the visual field. The function exists so that the
+    Horton & Hoyt (1991) cumulative area can be used directly as the `formfn`
+    argument of `cmag.fitting.fit_cumarea`, which recognizes it and evaluates
+    the closed form together with the MSE loss in a single fused pass.
+
+    Parameters
+    ----------
+    r : number or array or tensor
+        The eccentricity, in degrees, up to which the cumulative surface area
+        is computed.
+    a : float, optional
+        The parameter `a` of the model, in mm; the default value is 17.3, which
+        was measured by Horton & Hoyt (1991).
+    b : float, optional
+        The parameter `b` of the model, in degrees of the visual field; the
+        default value is 0.75, which was measured by Horton & Hoyt (1991).
+    hemifields : float, optional
+        The number of hemifields over which to integrate, with the default
+        being 2.
+
+    Returns
+    -------
+    float or array or tensor
+        The predicted V1 cortical surface area, in square mm, devoted to the
+        central `r` degrees of the visual field.
+    """
+    return HH91_integral(r, None, a, b, hemifields)
 
 def HH91_find_a(surfarea, ecc, max_eccen=None, /, b=0.75, hemifields=2):
     """Calculate the parameter `a` for the Horton & Hoyt (1991) model based on
@@ -214,15 +272,8 @@ def HH91_find_a(surfarea, ecc, max_eccen=None, /, b=0.75, hemifields=2):
       109(6):816-24. doi:10.1001/archopht.1991.01080060080030.
 
     """
-    from torch import is_tensor
-    from numpy import pi
     # Process the arguments:
     (r0,r1) = (0, ecc) if max_eccen is None else (ecc, max_eccen)
-    # Figure out which backend we're using:
-    if any(map(is_tensor, (surfarea, r0, r1, b))):
-        from torch import (log, sqrt)
-    else:
-        from numpy import (log, sqrt)
     # The HH91_integral function (above) gives the formula for the surface
     # area, A:
     #   A = 2*pi * (a**2) * (b * (1/(b+r1) - 1/(b+r0)) + log((b+r1)/(b+r0))).
@@ -231,5 +282,25 @@ def HH91_find_a(surfarea, ecc, max_eccen=None, /, b=0.75, hemifields=2):
     #  a = sqrt(A / (2*pi * (b * (1/(b+r1) - 1/(b+r0)) + log((b+r1)/(b+r0))))).
     b_r0 = b + r0
     b_r1 = b + r1
-    denom = (hemifields * pi * (b*(1/b_r1 - 1/b_r0) + log(b_r1/b_r0)))
-    return sqrt(surfarea / denom)
+    dr = r1 - r0
+    # A zero-width ring makes the denominator vanish, so catch the scalar
+    # case early with a clear error rather than returning an inf.
+    if not (torch.is_tensor(dr) or isinstance(dr, np.ndarray)) and dr == 0:
+        raise ValueError(
+            "HH91_find_a requires distinct eccentricities (got r0 == r1)")
+    # As in HH91_integral, the log1p form of the log term and the factored
+    # rational term b*(1/b_r1 - 1/b_r0) == -b*dr/(b_r1*b_r0) keep the
+    # denominator accurate in float32 even for thin eccentricity rings. The
+    # hemifields*pi constant is folded into the surface-area factor, which
+    # is constant across eccentricities, so only the eccentricity-dependent
+    # factor needs to be inverted.
+    if (torch.is_tensor(surfarea) or torch.is_tensor(r0)
+            or torch.is_tensor(r1) or torch.is_tensor(b)):
+        denom = (torch.log1p(torch.as_tensor(dr / b_r0))
+                 - b * dr / (b_r1 * b_r0))
+        # rsqrt inverts and roots in one instruction where sqrt-of-quotient
+        # needs a divide followed by a sqrt.
+        scale = torch.sqrt(torch.as_tensor(surfarea / (hemifields * pi)))
+        return torch.rsqrt(denom) * scale
+    denom = np.log1p(dr / b_r0) - b * dr / (b_r1 * b_r0)
+    return np.sqrt(surfarea / (hemifields * pi * denom))
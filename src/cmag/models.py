@@ -5,8 +5,35 @@
 """Models of cortical magnification.
 """
 
+from functools import lru_cache
+
 import torch
 import numpy as np
+from torch.distributions.beta import Beta
+from scipy.special import betainc, betaln
+
+from .fitting import log_exp
+from .hh91 import HH91, HH91_integral, HH91_find_a
+# The config module is imported (rather than the fov value) because the
+# config values are meant to be reassigned at runtime; the attribute is read
+# at call time. Note that cmag/__init__.py imports cmag.hcp before this
+# module, so this import does not recurse.
+from .hcp import config as _config
+
+
+@lru_cache(maxsize=256)
+def _hh91_a(total_area, max_eccen, b, hemifields):
+    """Returns the Horton & Hoyt (1991) `a` parameter for the given scalar
+    arguments, caching the result.
+
+    The `hh91` model classmethods solve for `a` from the total area on every
+    evaluation, but during a fit the optimizer calls them hundreds of times
+    with a handful of distinct parameter values; caching the solve on the
+    (hashable) scalar arguments makes the repeats free. Tensor arguments must
+    not be passed through this helper: they are unhashable, and a cached value
+    would detach the result from the autograd graph.
+    """
+    return HH91_find_a(total_area, 0, max_eccen, b=b, hemifields=hemifields)
 
 
 # CMagModel ###################################################################
@@ -14,6 +41,10 @@ import numpy as np
 class CMagModel:
     """A model of cortical magnification.
     """
+    # Subclasses may set this to a classmethod with the same signature as
+    # areal_cmag that computes on numpy arrays directly; __new__ then skips
+    # the torch round-trip for ndarray inputs.
+    _areal_cmag_np = None
     @classmethod
     def areal_cmag(cls, x, y, total_area, fov, *args):
         raise NotImplementedError
@@ -21,11 +52,40 @@ class CMagModel:
     def linear_cmag(cls, x, y, total_area, fov, *args):
         m = cls.areal_cmag(x, y, total_area, fov, *args)
         return torch.sqrt(m)
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Resolve the form -> implementation dispatch once per subclass so
+        # that __new__ does a dict lookup instead of string comparisons on
+        # every evaluation.
+        cls._form_impls = {
+            'areal': cls.areal_cmag,
+            'linear': cls.linear_cmag}
     def __new__(cls, x, y, /, *args,
                 total_area=1, fov=Ellipsis, device=None,
                 form='areal'):
-        torch_inputs = torch.is_tensor(x) or torch.is_tensor(y)
+        impl = cls._form_impls.get(form)
+        if impl is None:
+            raise ValueError(
+                "CMagModel form argument must be 'areal' or 'linear'")
         total_area = float(total_area)
+        # Pure-numpy path: for ndarray inputs on the CPU, wrapping in tensors
+        # just to unwrap the result costs two conversions and routes trivial
+        # elementwise math through torch's slower CPU dispatcher; models that
+        # provide a numpy kernel skip torch entirely.
+        if (cls._areal_cmag_np is not None and device is None
+                and not torch.is_tensor(x) and not torch.is_tensor(y)):
+            res = cls._areal_cmag_np(
+                np.asarray(x), np.asarray(y), total_area, fov, *args)
+            return np.sqrt(res) if form == 'linear' else res
+        # Fast path: when both inputs are already tensors on the requested
+        # device, the as_tensor rewraps and the per-argument conversion loop
+        # are pure overhead, and inside an optimizer loop that Python-level
+        # work dominates the evaluation; skip it entirely.
+        if (torch.is_tensor(x) and torch.is_tensor(y)
+                and x.device == y.device
+                and (device is None or x.device == torch.device(device))):
+            return impl(x, y, total_area, fov, *args)
+        torch_inputs = torch.is_tensor(x) or torch.is_tensor(y)
         x = torch.as_tensor(x, device=device)
         y = torch.as_tensor(y, device=device)
         tmp = []
@@ -34,16 +94,16 @@ class CMagModel:
                 tmp.append(torch.as_tensor(arg, device=device))
             except Exception:
                 tmp.append(arg)
-        if form == 'areal':
-            res = cls.areal_cmag(x, y, total_area, fov, *args)
-        elif form == 'linear':
-            res = cls.linear_cmag(x, y, total_area, fov, *args)
-        else:
-            raise ValueError(
-                "CMagModel form argument must be 'areal' or 'linear'")
+        res = impl(x, y, total_area, fov, *tmp)
         if not torch_inputs:
             res = res.detach().numpy()
         return res
+# __init_subclass__ only fires for subclasses, so the base class gets its
+# dispatch table here.
+CMagModel._form_impls = {
+    'areal': CMagModel.areal_cmag,
+    'linear': CMagModel.linear_cmag}
+
 class CMagRadialModel(CMagModel):
     @classmethod
     def radial_cumarea(cls, r, total_area, fov, hemifields, *args):
@@ -58,11 +118,18 @@ class CMagRadialModel(CMagModel):
             hemifields=2, **kw)
         return hemifields * torch.pi * r * cmag
     @classmethod
+    def areal_cmag_r(cls, r, total_area, fov, *args):
+        # Entry point for callers that already hold per-vertex
+        # eccentricities: x and y are fixed during a fit, so the hypot
+        # sweep only needs to run once outside the optimizer loop (or not
+        # at all, since the HCP cache stores eccentricity per vertex).
+        r = torch.as_tensor(r, dtype=float)
+        return cls.radial_cmag(r, total_area, fov, *args)
+    @classmethod
     def areal_cmag(cls, x, y, total_area, fov, *args):
         x = torch.as_tensor(x, dtype=float)
         y = torch.as_tensor(y, dtype=float)
-        r = torch.hypot(x, y)
-        return cls.radial_cmag(r, total_area, fov, *args)
+        return cls.areal_cmag_r(torch.hypot(x, y), total_area, fov, *args)
 
 class hh91(CMagRadialModel):
     """A cortical magnification model based on Horton and Hoyt's (1991) model.
@@ -102,24 +169,105 @@ class hh91(CMagRadialModel):
         `True`.
     """
     @classmethod
+    def _find_a(cls, total_area, max_eccen, b):
+        # The total area is always a bilateral surface area, so hemifields=2.
+        # Scalar arguments go through the memoized solver; tensors (which
+        # carry gradients and are unhashable) go straight to HH91_find_a.
+        if torch.is_tensor(total_area) or torch.is_tensor(b):
+            return HH91_find_a(total_area, 0, max_eccen, b=b, hemifields=2)
+        return _hh91_a(float(total_area), max_eccen, float(b), 2)
+    @classmethod
     def radial_cumarea(cls, r, total_area, fov, hemifields, b=0.75):
-        from .hh91 import HH91_integral, HH91_find_a
         if fov is Ellipsis:
-            from .hcp.config import fov
+            fov = _config.fov
         max_eccen = float(fov) / 2
-        # The total area is always a bilateral surface area, so hemifields=2.
-        a = HH91_find_a(total_area, 0, max_eccen, b=b, hemifields=2)
+        a = cls._find_a(total_area, max_eccen, b)
         return HH91_integral(0, r, a=a, b=b, hemifields=hemifields)
     @classmethod
     def radial_cmag(cls, r, total_area, fov, b=0.75):
-        from .hh91 import HH91, HH91_find_a
         if fov is Ellipsis:
-            from .hcp.config import fov
+            fov = _config.fov
         max_eccen = float(fov) / 2
-        # The total area is always a bilateral surface area, so hemifields=2.
-        a = HH91_find_a(total_area, 0, max_eccen, b=b, hemifields=2)
+        a = cls._find_a(total_area, max_eccen, b)
         return HH91(r, a, b)
-    argtx = (np.log, np.exp)
+    @classmethod
+    def areal_cmag(cls, x, y, total_area, fov, b=0.75):
+        if fov is Ellipsis:
+            fov = _config.fov
+        max_eccen = float(fov) / 2
+        a = cls._find_a(total_area, max_eccen, b)
+        x = torch.as_tensor(x, dtype=float)
+        y = torch.as_tensor(y, dtype=float)
+        # The closed form is evaluated directly rather than going through
+        # the base class's hypot-then-radial_cmag composition, which builds
+        # a full eccentricity tensor only to sweep it again in the model.
+        return (a / (b + torch.sqrt(x*x + y*y))) ** 2
+    @classmethod
+    def _areal_cmag_np(cls, x, y, total_area, fov, b=0.75):
+        if fov is Ellipsis:
+            fov = _config.fov
+        max_eccen = float(fov) / 2
+        a = cls._find_a(total_area, max_eccen, b)
+        # HH91 routes 1-d float arrays through the fused areal kernel in
+        # cmag._fastloss, so only the hypot intermediate is allocated here.
+        return HH91(np.hypot(x, y), a, b)
+    argtx = log_exp
+
+class _BetaInc(torch.autograd.Function):
+    """The regularized incomplete beta function `I_x(a, b)` with autograd
+    support.
+
+    Torch provides no betainc primitive, so the forward pass evaluates
+    `scipy.special.betainc` on detached values and the backward pass supplies
+    the gradients itself: the gradient with respect to `x` is the analytic
+    beta density `x**(a-1) * (1-x)**(b-1) / B(a, b)`, while the gradients
+    with respect to `a` and `b` (which have no closed form) are central
+    finite differences of the scipy call. This keeps a model built on the
+    beta CDF differentiable end-to-end instead of forcing the whole fit back
+    onto finite-difference Jacobians.
+    """
+    @staticmethod
+    def forward(ctx, a, b, x):
+        a_np = a.detach().cpu().numpy()
+        b_np = b.detach().cpu().numpy()
+        x_np = x.detach().cpu().numpy()
+        ctx.save_for_backward(a, b, x)
+        return torch.as_tensor(
+            betainc(a_np, b_np, x_np), dtype=x.dtype, device=x.device)
+    @staticmethod
+    def backward(ctx, grad):
+        (a, b, x) = ctx.saved_tensors
+        a_np = a.detach().cpu().numpy()
+        b_np = b.detach().cpu().numpy()
+        x_np = x.detach().cpu().numpy()
+        g = grad.detach().cpu().numpy()
+        (grad_a, grad_b, grad_x) = (None, None, None)
+        if ctx.needs_input_grad[0]:
+            da = 1e-6 * (abs(float(a_np)) + 1)
+            diff = (betainc(a_np + da, b_np, x_np)
+                    - betainc(a_np - da, b_np, x_np)) / (2 * da)
+            grad_a = torch.as_tensor(
+                np.sum(g * diff), dtype=a.dtype, device=a.device)
+            grad_a = grad_a.reshape(a.shape)
+        if ctx.needs_input_grad[1]:
+            db = 1e-6 * (abs(float(b_np)) + 1)
+            diff = (betainc(a_np, b_np + db, x_np)
+                    - betainc(a_np, b_np - db, x_np)) / (2 * db)
+            grad_b = torch.as_tensor(
+                np.sum(g * diff), dtype=b.dtype, device=b.device)
+            grad_b = grad_b.reshape(b.shape)
+        if ctx.needs_input_grad[2]:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                pdf = np.exp(
+                    (a_np - 1) * np.log(x_np)
+                    + (b_np - 1) * np.log1p(-x_np)
+                    - betaln(a_np, b_np))
+            # The density can be singular at the endpoints; a zero gradient
+            # there keeps the optimizer step finite.
+            pdf = np.nan_to_num(pdf, nan=0.0, posinf=0.0)
+            grad_x = torch.as_tensor(
+                g * pdf, dtype=x.dtype, device=x.device)
+        return (grad_a, grad_b, grad_x)
 
 class beta(CMagRadialModel):
     """A cortical magnification model based on the beta distribution.
@@ -165,18 +313,23 @@ class beta(CMagRadialModel):
     """
     @classmethod
     def radial_cumarea(cls, r, total_area, fov, hemifields, a=2.0, b=3.0):
-        from scipy.stats import beta
         if fov is Ellipsis:
-            from .hcp.config import fov
+            fov = _config.fov
         max_eccen = float(fov) / 2
         const = total_area * hemifields / 2
-        b = const * beta.cdf((r / max_eccen).numpy(), a, b)
-        return torch.as_tensor(b)
+        r = torch.as_tensor(r)
+        ratio = r / max_eccen
+        # _BetaInc evaluates the beta CDF without detaching the inputs from
+        # the autograd graph, so fits of this model can use analytic
+        # Jacobians. (The old scipy.stats.beta.cdf round-trip also clobbered
+        # the parameter b with the result.)
+        a = torch.as_tensor(a, dtype=ratio.dtype)
+        b = torch.as_tensor(b, dtype=ratio.dtype)
+        return const * _BetaInc.apply(a, b, ratio)
     @classmethod
     def radial_area(cls, r, total_area, fov, hemifields, a=2.0, b=3.0):
-        from torch.distributions.beta import Beta
         if fov is Ellipsis:
-            from .hcp.config import fov
+            fov = _config.fov
         max_eccen = float(fov) / 2
         const = total_area * hemifields / 2
         return const * Beta(a, b).log_prob(r / max_eccen).exp()
@@ -189,16 +342,29 @@ class beta(CMagRadialModel):
     @classmethod
     def radial_cmag(cls, r, total_area, fov, a=1.0, b=3.0):
         if fov is Ellipsis:
-            from .hcp.config import fov
+            fov = _config.fov
         max_eccen = float(fov) / 2
         const = total_area / (2 * torch.pi * max_eccen)
+        r = torch.as_tensor(r)
         pdf = cls.radial_area(r, 1, fov, 2, a=a, b=b)
-        pdf_adj = pdf / r
+        zero_mask = (r == 0)
+        if not zero_mask.any():
+            # The typical case: no zeros, so no fixup pass is needed.
+            return const * pdf / r
+        # At r == 0 the division is singular, so the limiting value is
+        # patched in with torch.where; unlike a masked fancy-index write,
+        # this works for scalar (0-dim) r as well. The clamped divisor
+        # keeps the division itself from producing nan/inf at the patched
+        # positions.
         if a < 2:
-            pdf_adj[r == 0] = torch.inf
+            fill = torch.inf
         elif a > 2:
-            pdf_adj[r == 0] = 0
+            fill = 0.0
         else:
-            pdf_adj[r == 0] = torch.pow(max_eccen, 1 - a) / beta._beta(a,b)
-        return const * pdf_adj
-    argtx = (np.log, np.exp)
+            fill = torch.pow(
+                torch.as_tensor(max_eccen, dtype=pdf.dtype), 1 - a)
+            fill = fill / cls._beta(torch.as_tensor(a), torch.as_tensor(b))
+        fill = torch.as_tensor(fill, dtype=pdf.dtype)
+        pdf_adj = pdf / torch.where(zero_mask, torch.ones_like(r), r)
+        return const * torch.where(zero_mask, fill, pdf_adj)
+    argtx = log_exp